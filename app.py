@@ -1,32 +1,138 @@
 import modal
+import asyncio
 import os
 import sqlite3
 import uuid
 import time
-import json
-import base64
-import requests
+import threading
+import queue
+import atexit
+import hashlib
+import io
+import logging
+import functools
 from typing import Optional, Dict, Any, List
-
-from fasthtml.common import *
-from starlette.responses import JSONResponse, HTMLResponse, RedirectResponse
+try:
+    # Fast JSON, installed in the Modal image; only the containers use it, so the machine
+    # running `modal deploy` doesn't need it
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    # SIMD base64 (installed in the Modal image) with the same API as the stdlib module
+    import pybase64 as base64
+except ImportError:
+    import base64
 
 # Define app
 app = modal.App("building_restoration")
 
+# Exception paths log through logging so failures keep their tracebacks
+logger = logging.getLogger(__name__)
+
 # Define secret to access OpenAI API key
 openai_secret = modal.Secret.from_name("openai-api-key")
 
 # Constants and directories
 DATA_DIR = "/data"
-RESULTS_FOLDER = "/data/restoration_results"
 DB_PATH = "/data/building_restoration.db"
 STATUS_DIR = "/data/status"
+ASSETS_DIR = "/assets"
+
+# Create the database directory once per container instead of on every open
+if not modal.is_local():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 # OpenAI API URLs
 OPENAI_GENERATIONS_URL = "https://api.openai.com/v1/images/generations"
 OPENAI_EDITS_URL = "https://api.openai.com/v1/images/edits"
 
+# Image endpoint this account accepts ("generations" or "edits"); seeded from
+# OPENAI_ENDPOINT and switched to edits the first time generations rejects a request
+_preferred_endpoint = None
+
+def get_preferred_endpoint() -> str:
+    """Return the endpoint to call first, reading OPENAI_ENDPOINT on first use"""
+    global _preferred_endpoint
+    if _preferred_endpoint is None:
+        _preferred_endpoint = "edits" if os.environ.get("OPENAI_ENDPOINT", "").lower() == "edits" else "generations"
+    return _preferred_endpoint
+
+# Headers for JSON API calls; authorization is set once on the session
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# (connect, read) timeouts for OpenAI calls; high-quality generations can take a couple of
+# minutes, but a stalled connection shouldn't hang until the function's 300 s timeout
+OPENAI_TIMEOUT = (10, 180)
+
+# Shared HTTP session so warm containers reuse keep-alive connections to OpenAI
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Return the container's pooled requests.Session, creating it on first use"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                from urllib3.util.retry import Retry
+                
+                # A 5xx, reset or read timeout on a POST may hide an image that was already
+                # generated (and billed). POST is left out of allowed_methods so urllib3 never
+                # re-sends it after a read error, and is only retried on an explicit rate limit
+                class OpenAIRetry(Retry):
+                    def is_retry(self, method, status_code, has_retry_after=False):
+                        if method == "POST":
+                            return status_code == 429
+                        return super().is_retry(method, status_code, has_retry_after)
+                
+                # raise_on_status=False hands back the last response once retries run out, so
+                # raise_for_status() still sees OpenAI's error body (e.g. insufficient_quota)
+                retries = OpenAIRetry(
+                    total=3,
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 502, 503, 504),
+                    allowed_methods=frozenset({"GET"}),
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+                session = requests.Session()
+                session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retries))
+                
+                # The key comes from the Modal secret and never changes within a container
+                api_key = os.environ.get("OPENAI_API_KEY")
+                if api_key:
+                    session.headers["Authorization"] = f"Bearer {api_key}"
+                _http_session = session
+    return _http_session
+
+# SQL used on every restoration; fixed strings let sqlite3 reuse its compiled statements
+INSERT_RESULT_SQL = (
+    "INSERT INTO results (id, style, prompt, original_image, restored_image, additional_details) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+INSERT_CACHE_SQL = "INSERT OR REPLACE INTO restoration_cache (image_hash, options_hash, result_id) VALUES (?, ?, ?)"
+CACHED_RESULT_SQL = """
+    SELECT r.id, r.style, r.prompt, r.original_image, r.restored_image, r.additional_details
+    FROM restoration_cache c JOIN results r ON r.id = c.result_id
+    WHERE c.image_hash = ? AND c.options_hash = ?
+"""
+
+# Images sent to the API are capped at this size on the long edge and re-encoded as JPEG
+MAX_IMAGE_DIMENSION = 1024
+IMAGE_JPEG_QUALITY = 80
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Restored images are requested as WebP, which is much smaller than the default PNG
+RESTORED_IMAGE_FORMAT = "webp"
+RESTORED_IMAGE_COMPRESSION = 80
+
+# Output quality options mapped to gpt-image-1 quality tiers; the low tier is several
+# times faster and cheaper, so quick previews are the default
+QUALITY_LEVELS = {"fast": "low", "hd": "high"}
+DEFAULT_QUALITY = "fast"
+
 # Restoration style options
 RESTORATION_STYLES = [
     "Modern renovation", 
@@ -42,11 +148,22 @@ RESTORATION_STYLES = [
 # Create custom image with all dependencies
 image = (
     modal.Image.debian_slim(python_version="3.10")
-    .apt_install("git")
+    .apt_install("git", "curl", "build-essential", "libjpeg62-turbo-dev", "zlib1g-dev")
     .pip_install(
         "requests",
+        "orjson",
+        "pybase64",
         "python-fasthtml==0.12.0"
     )
+    # Pillow-SIMD (built against libjpeg-turbo with AVX2) speeds up JPEG decode and resizing;
+    # fall back to stock Pillow where it won't build
+    .run_commands('CC="cc -mavx2" pip install --no-cache-dir pillow-simd || pip install --no-cache-dir pillow')
+    # Bake the CSS frameworks into the image so pages don't depend on third-party CDNs
+    .run_commands(
+        f"mkdir -p {ASSETS_DIR}",
+        f"curl -fsSL -o {ASSETS_DIR}/daisyui.css https://cdn.jsdelivr.net/npm/daisyui@3.9.2/dist/full.css",
+        f"curl -fsSL -o {ASSETS_DIR}/tailwind.min.css https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css"
+    )
 )
 
 # Look up data volume for storing results
@@ -66,37 +183,57 @@ Make the surrounding area clean and well-maintained.
 The result should look like a professional architectural visualization of the restored building.
 """
 
-# Function to save results to file
-def save_results_file(result_id, result_content):
-    """Save restoration results to a file"""
-    os.makedirs(RESULTS_FOLDER, exist_ok=True)
-    result_file = os.path.join(RESULTS_FOLDER, f"{result_id}.json")
-    result_data = {
-        "id": result_id,
-        "result": result_content,
-        "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
-    }
+# Build the restoration prompt; there are only a few hundred option combinations
+@functools.lru_cache(maxsize=256)
+def build_restoration_prompt(style: str, preserve_heritage: bool, landscaping: bool,
+                             lighting: bool, expand_building: bool) -> str:
+    """Format RESTORATION_PROMPT for a style and set of toggles"""
+    style_instruction = f"Use a {style} style for the restoration."
     
-    try:
-        with open(result_file, "w") as f:
-            json.dump(result_data, f)
-        print(f"✅ Saved result file for ID: {result_id}")
-        return True
-    except Exception as e:
-        print(f"⚠️ Error saving result file: {e}")
-        return False
+    # Build additional instructions based on options
+    additional_instructions = []
+    
+    if preserve_heritage:
+        additional_instructions.append("Preserve historical and heritage elements of the building.")
+        
+    if landscaping:
+        additional_instructions.append("Add attractive landscaping and greenery around the building.")
+        
+    if lighting:
+        additional_instructions.append("Add modern and attractive lighting to highlight architectural features.")
+    
+    if expand_building:
+        additional_instructions.append("Consider a tasteful expansion or addition that complements the original structure.")
+    
+    return RESTORATION_PROMPT.format(
+        style_instruction=style_instruction,
+        additional_instructions=" ".join(additional_instructions)
+    )
+
+# Warm the cache with the default (all toggles off) prompt
+build_restoration_prompt(RESTORATION_STYLES[0], False, False, False, False)
 
 # Setup database for restoration results
 def setup_database(db_path: str):
     """Initialize SQLite database for restoration results"""
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    
-    conn = sqlite3.connect(db_path, timeout=30.0)
+    conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False, cached_statements=256,
+                           isolation_level=None)
     cursor = conn.cursor()
     
-    # Enable WAL mode for better concurrency
+    # Enable WAL mode for better concurrency; results are regenerable, so skip fsyncs
     cursor.execute("PRAGMA journal_mode=WAL;")
-    cursor.execute("PRAGMA synchronous=NORMAL;")
+    cursor.execute("PRAGMA synchronous=OFF;")
+    
+    # Larger page cache, in-memory temp tables, mmap'd reads and retry-on-busy
+    cursor.execute("PRAGMA cache_size=-65536;")
+    cursor.execute("PRAGMA temp_store=MEMORY;")
+    cursor.execute("PRAGMA mmap_size=268435456;")
+    cursor.execute("PRAGMA busy_timeout=30000;")
+    cursor.execute("PRAGMA wal_autocheckpoint=1000;")
+    cursor.execute("PRAGMA journal_size_limit=6144000;")
+    
+    # Let SQLite refresh stale planner statistics for this long-lived connection
+    cursor.execute("PRAGMA optimize=0x10002;")
     
     # Create tables for restoration results
     cursor.execute("""
@@ -104,8 +241,8 @@ def setup_database(db_path: str):
             id TEXT PRIMARY KEY,
             style TEXT NOT NULL,
             prompt TEXT NOT NULL,
-            original_image TEXT NOT NULL,
-            restored_image TEXT NOT NULL,
+            original_image BLOB NOT NULL,
+            restored_image BLOB NOT NULL,
             additional_details TEXT,
             status TEXT DEFAULT 'generated',
             feedback TEXT DEFAULT NULL, 
@@ -113,23 +250,301 @@ def setup_database(db_path: str):
         )
     """)
     
+    # Map (image content, options) to a previous result so repeat uploads skip the API
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS restoration_cache (
+            image_hash TEXT NOT NULL,
+            options_hash TEXT NOT NULL,
+            result_id TEXT NOT NULL,
+            PRIMARY KEY (image_hash, options_hash)
+        )
+    """)
+    
     conn.commit()
     return conn
 
+# Connection shared by everything running in this container
+_db_conn: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+
+# Warm containers re-run PRAGMA optimize periodically instead of only at startup
+DB_OPTIMIZE_INTERVAL = 15 * 60
+
+def _db_optimizer():
+    """Run PRAGMA optimize on the shared connection every DB_OPTIMIZE_INTERVAL seconds"""
+    while True:
+        time.sleep(DB_OPTIMIZE_INTERVAL)
+        try:
+            with _db_lock:
+                _db_conn.execute("PRAGMA optimize;")
+        except Exception:
+            logger.exception("Error optimizing database")
+
+def get_db_connection() -> sqlite3.Connection:
+    """Return the container's SQLite connection, opening it on first use"""
+    global _db_conn
+    if _db_conn is None:
+        with _db_lock:
+            if _db_conn is None:
+                _db_conn = setup_database(DB_PATH)
+                threading.Thread(target=_db_optimizer, daemon=True).start()
+    return _db_conn
+
+# Result writes are queued and committed in batches by a background thread
+DB_FLUSH_INTERVAL = 0.05
+_pending_writes: "queue.Queue[tuple]" = queue.Queue()
+_writes_ready = threading.Event()
+_writer_thread: Optional[threading.Thread] = None
+
+def flush_pending_writes():
+    """Commit every queued statement in a single transaction"""
+    writes: List[tuple] = []
+    while True:
+        try:
+            writes.append(_pending_writes.get_nowait())
+        except queue.Empty:
+            break
+    
+    if not writes:
+        return
+    
+    batch: Dict[str, List[tuple]] = {}
+    for sql, params in writes:
+        batch.setdefault(sql, []).append(params)
+    
+    # The connection is in autocommit mode; take the write lock up front for the whole batch
+    conn = get_db_connection()
+    with _db_lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, rows in batch.items():
+                conn.executemany(sql, rows)
+            conn.execute("COMMIT")
+            return
+        except Exception:
+            conn.execute("ROLLBACK")
+            logger.exception("Batched write of %d statements failed, retrying them one by one", len(writes))
+        
+        # One bad row must not take the rest of the batch down with it
+        for sql, params in writes:
+            try:
+                conn.execute(sql, params)
+            except Exception:
+                logger.exception("Dropped queued write for %s: %s", params[0], sql.split("(")[0].strip())
+
+def _db_writer():
+    """Flush queued writes shortly after they arrive"""
+    while True:
+        _writes_ready.wait()
+        time.sleep(DB_FLUSH_INTERVAL)
+        _writes_ready.clear()
+        try:
+            flush_pending_writes()
+        except Exception:
+            logger.exception("Error writing results to database")
+
+def queue_db_write(sql: str, params: tuple):
+    """Queue a statement for the next batched commit"""
+    global _writer_thread
+    if _writer_thread is None:
+        with _db_lock:
+            if _writer_thread is None:
+                _writer_thread = threading.Thread(target=_db_writer, daemon=True)
+                _writer_thread.start()
+    _pending_writes.put((sql, params))
+    _writes_ready.set()
+
+# Drain anything still queued when the container shuts down
+def close_database():
+    """Flush queued writes and refresh query planner statistics"""
+    flush_pending_writes()
+    if _db_conn is not None:
+        with _db_lock:
+            _db_conn.execute("PRAGMA optimize;")
+
+atexit.register(close_database)
+
+# Images are stored as raw bytes; rows written before that hold base64 text
+def image_to_base64(value) -> str:
+    """Return a stored image column as a base64 string"""
+    if isinstance(value, str):
+        return value
+    return base64.b64encode(value).decode('utf-8')
+
+# Look up a previous restoration of the same image with the same options
+def get_cached_result(conn, image_hash: str, options_hash: str) -> Optional[Dict[str, Any]]:
+    """Return a stored restoration for this image/options pair, or None"""
+    # Reads share the writer's connection, so they must not run inside its open transaction
+    with _db_lock:
+        row = conn.execute(
+            CACHED_RESULT_SQL,
+            (image_hash, options_hash)
+        ).fetchone()
+    
+    if row is None:
+        return None
+    
+    # The caller already has the original upload, so only the restored image is sent back
+    result = result_row_to_dict(row)
+    del result["original_image"]
+    result["cached"] = True
+    return result
+
+# Identify an image format from its leading bytes
+def sniff_image_type(data: bytes) -> str:
+    """Return the media type of PNG, WebP or JPEG image data"""
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+# Shape a results row like the response of restore_building_image
+def result_row_to_dict(row) -> Dict[str, Any]:
+    """Convert a results table row into a restoration result dictionary"""
+    result_id, style, prompt, original_image, restored_image, additional_details = row
+    return {
+        "id": result_id,
+        "style": style,
+        "prompt": prompt,
+        "original_image": image_to_base64(original_image),
+        "restored_image": image_to_base64(restored_image),
+        "options": orjson.loads(additional_details) if additional_details else {},
+        "usage": {}
+    }
+
+# Shrink uploads before they are sent to OpenAI; API callers may skip the browser's downscale
+def prepare_image(image_binary: bytes) -> bytes:
+    """Downscale an image to MAX_IMAGE_DIMENSION and re-encode it as JPEG"""
+    from PIL import Image, ImageOps
+    
+    with Image.open(io.BytesIO(image_binary)) as img:
+        # Browser uploads are already small, upright RGB JPEGs; send those bytes untouched
+        upright = img.getexif().get(EXIF_ORIENTATION_TAG, 1) == 1
+        if img.format == "JPEG" and img.mode == "RGB" and upright and max(img.size) <= MAX_IMAGE_DIMENSION:
+            return image_binary
+        
+        # Let the JPEG decoder scale large photos down while decoding (no-op for other formats),
+        # keeping 2x headroom so the final LANCZOS pass still has detail to work with
+        img.draft("RGB", (MAX_IMAGE_DIMENSION * 2, MAX_IMAGE_DIMENSION * 2))
+        
+        # The re-encode drops EXIF, so apply the camera's orientation to the pixels first
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        
+        # JPEG has no alpha channel, so flatten transparency onto white like the browser does
+        if img.mode in ("RGBA", "LA", "P"):
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, "white")
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        
+        buffer = io.BytesIO()
+        img.convert("RGB").save(buffer, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+# Send one restoration to OpenAI through the endpoint this account accepts
+def call_openai_image_api(prompt: str, image_binary: bytes, quality: str = QUALITY_LEVELS[DEFAULT_QUALITY]) -> Dict[str, Any]:
+    """Call the preferred image endpoint and return the restored image as base64 and bytes, plus usage"""
+    global _preferred_endpoint
+    import requests
+    http_session = get_http_session()
+    
+    def post(endpoint: str) -> Dict[str, Any]:
+        print(f"🔄 Calling the {endpoint} endpoint...")
+        if endpoint == "edits":
+            # Edits takes the source image as multipart form data
+            url = OPENAI_EDITS_URL
+            request_kwargs = {"files": {
+                'image': ('image.jpg', image_binary, 'image/jpeg'),
+                'prompt': (None, prompt),
+                'model': (None, 'gpt-image-1'),
+                'n': (None, '1'),
+                'size': (None, 'auto'),
+                'quality': (None, quality),
+                'output_format': (None, RESTORED_IMAGE_FORMAT),
+                'output_compression': (None, str(RESTORED_IMAGE_COMPRESSION))
+            }}
+        else:
+            url = OPENAI_GENERATIONS_URL
+            request_kwargs = {"headers": JSON_HEADERS, "data": orjson.dumps({
+                "model": "gpt-image-1",
+                "prompt": prompt,
+                "n": 1,
+                "size": "1024x1024",
+                "quality": quality,
+                "output_format": RESTORED_IMAGE_FORMAT,
+                "output_compression": RESTORED_IMAGE_COMPRESSION,
+                "response_format": "b64_json"
+            })}
+        
+        response = http_session.post(url, timeout=OPENAI_TIMEOUT, **request_kwargs)
+        response.raise_for_status()
+        print(f"✅ {endpoint.capitalize()} endpoint successful")
+        return orjson.loads(response.content)
+    
+    try:
+        endpoint = get_preferred_endpoint()
+        try:
+            result = post(endpoint)
+        except requests.exceptions.HTTPError as e:
+            # A 4xx other than auth/rate limiting means this account needs edits;
+            # remember that so later requests in this container skip generations
+            status = e.response.status_code if e.response is not None else None
+            if endpoint == "edits" or status is None or not 400 <= status < 500 or status in (401, 429):
+                raise
+            print(f"⚠️ Generations endpoint rejected the request ({status}), switching to edits")
+            result = post("edits")
+            _preferred_endpoint = "edits"
+        
+        print(f"📊 API response structure: {list(result.keys())}")
+        if not result.get('data'):
+            print(f"⚠️ Unexpected API response format: {result}")
+            raise Exception("No image data returned from API")
+        
+        image_info = result['data'][0]
+        if 'b64_json' in image_info:
+            print("✅ Received base64 image data")
+            restored_b64 = image_info['b64_json']
+            restored_binary = base64.b64decode(restored_b64)
+        else:
+            # If image URL is returned instead of base64
+            print("✅ Received image URL, fetching content...")
+            # Image URLs are not OpenAI's API, so don't send the key along
+            img_response = http_session.get(image_info['url'], headers={"Authorization": None}, timeout=OPENAI_TIMEOUT)
+            img_response.raise_for_status()
+            restored_binary = img_response.content
+            restored_b64 = base64.b64encode(restored_binary).decode('utf-8')
+        
+    except requests.exceptions.RequestException as e:
+        error_details = str(e)
+        if hasattr(e, 'response') and e.response is not None:
+            try:
+                error_json = e.response.json()
+                if 'error' in error_json:
+                    error_details = f"{error_json['error'].get('message', str(e))}"
+            except:
+                pass
+        
+        raise Exception(f"API Error: {error_details}. Please verify your API key has the proper permissions.")
+    
+    return {"b64": restored_b64, "binary": restored_binary, "usage": result.get("usage", {})}
+
 # Generate restoration using OpenAI's API
 @app.function(
     image=image,
     cpu=1.0,
     timeout=300,
     volumes={DATA_DIR: building_volume},
-    secrets=[openai_secret]  # Use the Modal secret
+    secrets=[openai_secret],  # Use the Modal secret
+    # Restorations mostly wait on OpenAI, so a warm container serves several at once
+    allow_concurrent_inputs=4
 )
-def restore_building_image(image_data: str, options: Dict[str, Any]) -> Dict[str, Any]:
+def restore_building_image(image_binary: bytes, options: Dict[str, Any]) -> Dict[str, Any]:
     """
     Generate building restoration using OpenAI's GPT Image API
     
     Args:
-        image_data: Base64 encoded image
+        image_binary: Raw bytes of the uploaded JPEG
         options: Dictionary of restoration options
     
     Returns:
@@ -147,172 +562,773 @@ def restore_building_image(image_data: str, options: Dict[str, Any]) -> Dict[str
             "help": "Please create a Modal secret with 'modal secret create openai-api-key OPENAI_API_KEY=your-key'."
         }
     
+    if not image_binary:
+        return {"error": "No image data provided"}
+    
+    # Missing or unknown quality values mean the default, so they share its cache entry
+    if options.get("quality") not in QUALITY_LEVELS:
+        options = {**options, "quality": DEFAULT_QUALITY}
+    
+    # Identical image + options pairs are served from the database
+    image_hash = hashlib.blake2b(image_binary, digest_size=16).hexdigest()
+    options_hash = hashlib.blake2b(orjson.dumps(options, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+    
+    try:
+        cached = get_cached_result(get_db_connection(), image_hash, options_hash)
+        if cached:
+            print(f"✅ Cache hit for image {image_hash[:12]}, returning result {cached['id']}")
+            return cached
+    except Exception:
+        logger.exception("Error reading restoration cache")
+    
+    try:
+        image_binary = prepare_image(image_binary)
+    except Exception as e:
+        return {"error": f"Invalid image data: {e}"}
+    
     result_id = uuid.uuid4().hex
     
     # Get selected style
     selected_style = options.get("style", "Modern renovation")
-    style_instruction = f"Use a {selected_style} style for the restoration."
+    prompt = build_restoration_prompt(
+        selected_style,
+        bool(options.get("preserve_heritage", False)),
+        bool(options.get("landscaping", False)),
+        bool(options.get("lighting", False)),
+        bool(options.get("expand_building", False))
+    )
     
-    # Build additional instructions based on options
-    additional_instructions = []
+    print("🔍 Sending image to OpenAI for restoration visualization...")
     
-    if options.get("preserve_heritage", False):
-        additional_instructions.append("Preserve historical and heritage elements of the building.")
+    try:
+        quality = QUALITY_LEVELS[options["quality"]]
+        restored = call_openai_image_api(prompt, image_binary, quality)
+        restored_binary = restored["binary"]
         
-    if options.get("landscaping", False):
-        additional_instructions.append("Add attractive landscaping and greenery around the building.")
+        # Queue the result for the background database writer; a failure here must not
+        # throw away an image the API has already generated (and billed)
+        try:
+            queue_db_write(
+                INSERT_RESULT_SQL,
+                (result_id, selected_style, prompt, image_binary, restored_binary, orjson.dumps(options).decode())
+            )
+            queue_db_write(INSERT_CACHE_SQL, (image_hash, options_hash, result_id))
+        except Exception:
+            logger.exception("Non-fatal error saving result %s to database", result_id)
         
-    if options.get("lighting", False):
-        additional_instructions.append("Add modern and attractive lighting to highlight architectural features.")
+        return {
+            "id": result_id,
+            "style": selected_style,
+            "prompt": prompt,
+            "restored_image": restored["b64"],
+            "options": options,
+            "usage": restored["usage"]
+        }
+        
+    except Exception as e:
+        logger.exception("Error generating restoration %s", result_id)
+        return {
+            "error": str(e),
+            "id": result_id
+        }
+
+# Restore several buildings with the same options in one call
+@app.function(
+    image=image,
+    cpu=0.25,
+    timeout=900
+)
+def restore_building_images(images: List[bytes], options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Restore a batch of building images that share the same options
     
-    if options.get("expand_building", False):
-        additional_instructions.append("Consider a tasteful expansion or addition that complements the original structure.")
+    Each image is handled by restore_building_image in parallel containers, so the
+    caller pays one round-trip for the whole batch instead of one per image.
     
-    # Prepare the prompt
-    additional_instructions_text = " ".join(additional_instructions) if additional_instructions else ""
+    Args:
+        images: Raw image bytes
+        options: Dictionary of restoration options applied to every image
     
-    prompt = RESTORATION_PROMPT.format(
-        style_instruction=style_instruction,
-        additional_instructions=additional_instructions_text
-    )
+    Returns:
+        Restoration results in the same order as the input images
+    """
+    return list(restore_building_image.map(images, kwargs={"options": options}))
+
+# Dashboard theme, served from /static/theme.css rather than inlined into every page
+THEME_CSS = """
+:root {
+    --color-base-100: oklch(98% 0.002 247.839);
+    --color-base-200: oklch(96% 0.003 264.542);
+    --color-base-300: oklch(92% 0.006 264.531);
+    --color-base-content: oklch(21% 0.034 264.665);
+    --color-primary: oklch(47% 0.196 209.957);  /* Blue for architecture */
+    --color-primary-content: oklch(97% 0.014 254.604);
+    --color-secondary: oklch(74% 0.134 119.635);  /* Green for renewal */
+    --color-secondary-content: oklch(13% 0.028 261.692);
+    --color-accent: oklch(71% 0.134 41.252);     /* Tan accent for buildings */
+    --color-accent-content: oklch(97% 0.014 254.604);
+    --color-neutral: oklch(13% 0.028 261.692);
+    --color-neutral-content: oklch(98% 0.002 247.839);
+    --color-info: oklch(58% 0.158 241.966);
+    --color-info-content: oklch(97% 0.013 236.62);
+    --color-success: oklch(62% 0.194 149.214);
+    --color-success-content: oklch(98% 0.018 155.826);
+    --color-warning: oklch(66% 0.179 58.318);
+    --color-warning-content: oklch(98% 0.022 95.277);
+    --color-error: oklch(59% 0.249 0.584);
+    --color-error-content: oklch(97% 0.014 343.198);
+}
+
+/* Custom styling */
+.text-arch-blue {
+    color: oklch(47% 0.196 209.957);
+}
+
+.bg-renew-green {
+    background-color: oklch(74% 0.134 119.635);
+}
+
+.custom-border {
+    border-color: var(--color-base-300);
+}
+
+/* Comparison slider */
+.comparison-slider {
+    position: relative;
+    width: 100%;
+    overflow: hidden;
+    border-radius: 0.5rem;
+    margin: 1rem 0;
+}
+
+.before-after-container {
+    position: relative;
+    width: 100%;
+    height: 400px;
+}
+
+.before-image,
+.after-image {
+    position: absolute;
+    top: 0;
+    left: 0;
+    width: 100%;
+    height: 100%;
+    object-fit: cover;
+}
+
+/* The after image is clipped rather than resized, so dragging only touches the compositor */
+.after-image {
+    clip-path: inset(0 50% 0 0);
+    will-change: clip-path;
+}
+
+.slider-handle {
+    position: absolute;
+    top: 0;
+    bottom: 0;
+    left: 50%;
+    width: 4px;
+    background: white;
+    transform: translateX(-50%);
+    will-change: transform;
+    cursor: ew-resize;
+    touch-action: none;
+    z-index: 10;
+}
+
+.slider-handle::before {
+    content: '';
+    position: absolute;
+    top: 50%;
+    left: 50%;
+    transform: translate(-50%, -50%);
+    width: 30px;
+    height: 30px;
+    background: white;
+    border-radius: 50%;
+    box-shadow: 0 0 5px rgba(0,0,0,0.5);
+}
+
+.slider-label {
+    position: absolute;
+    top: 10px;
+    padding: 5px 10px;
+    background: rgba(0,0,0,0.7);
+    color: white;
+    border-radius: 4px;
+    font-size: 12px;
+    z-index: 5;
+}
+
+.before-label {
+    left: 10px;
+}
+
+.after-label {
+    right: 10px;
+}
+"""
+
+# Dashboard client script, served from /static/app.js so browsers cache it between visits
+APP_JS = """
+document.addEventListener('DOMContentLoaded', function() {
+    // Form elements
+    const imageInput = document.getElementById('image-input');
+    const imagePreview = document.getElementById('image-preview');
+    const imageError = document.getElementById('image-error');
+    const restoreButton = document.getElementById('restore-button');
     
-    print("🔍 Sending image to OpenAI for restoration visualization...")
+    // Results elements
+    const loadingIndicator = document.getElementById('loading-indicator').parentElement;
+    const loadingStatus = document.getElementById('loading-status');
+    const resultsPlaceholder = document.getElementById('results-placeholder');
+    const resultsContent = document.getElementById('results-content');
+    const comparisonContainer = document.getElementById('comparison-container');
+    const restorationDetails = document.getElementById('restoration-details');
+    const resultActions = document.getElementById('result-actions');
+    const downloadButton = document.getElementById('download-button');
+    const newButton = document.getElementById('new-button');
     
-    try:
-        # Save original image for comparison
-        original_img_data = image_data
-        
-        # Decode base64 to binary
-        image_binary = base64.b64decode(image_data)
+    // State variables
+    let originalImageBlob = null;
+    let originalPreviewUrl = null;
+    let restoredImageUrl = null;
+    let restoredImageExtension = 'webp';
+    
+    // Aborts the in-flight /restore request when the image is cleared or replaced
+    let restoreController = null;
+    
+    // Leading-edge submit throttle: ignore clicks while a restoration is running or
+    // within RESTORE_THROTTLE_MS of the last submission (double clicks)
+    const RESTORE_THROTTLE_MS = 300;
+    let lastRestoreAt = 0;
+    let restoreInFlight = false;
+    
+    // Uploads are downscaled in the browser to cut bandwidth and API image tokens
+    const MAX_UPLOAD_DIMENSION = 1024;
+    const UPLOAD_JPEG_QUALITY = 0.85;
+    
+    // Files are checked before decoding so unsupported or oversized uploads fail here,
+    // not after a round trip to the server
+    const ACCEPTED_IMAGE_TYPES = ['image/jpeg', 'image/png'];
+    const MAX_SOURCE_FILE_BYTES = 20 * 1024 * 1024;
+    
+    // Check for demo mode (if no API key is available)
+    const isDemoMode = false; // This can be set server-side if needed
+    
+    // Option controls, looked up once rather than on every submit
+    const styleSelect = document.querySelector('select[name="style"]');
+    const qualitySelect = document.querySelector('select[name="quality"]');
+    const toggleInputs = ['preserve_heritage', 'landscaping', 'lighting', 'expand_building']
+        .map(name => document.querySelector(`input[name="${name}"]`));
+    
+    // Get options from the form
+    function getOptions() {
+        const options = {
+            style: styleSelect.value,
+            quality: qualitySelect.value
+        };
+        toggleInputs.forEach(input => { options[input.name] = input.checked; });
+        return options;
+    }
+    
+    // Handle image upload
+    imageInput.addEventListener('change', function(event) {
+        handleImageFile(event.target.files[0]);
+    });
+    
+    // Preview and stage a file chosen through the input or dropped on the dropzone
+    function handleImageFile(file) {
+        if (!file) {
+            resetForm();
+            return;
+        }
         
-        # Prepare the request for OpenAI API
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
+        if (!ACCEPTED_IMAGE_TYPES.includes(file.type)) {
+            showImageError('Please choose a JPEG or PNG image.');
+            return;
+        }
+        if (file.size > MAX_SOURCE_FILE_BYTES) {
+            showImageError('This image is larger than 20 MB. Please choose a smaller file.');
+            return;
         }
+        imageError.classList.add('hidden');
         
-        print("🔍 Using OpenAI API: generations endpoint")
+        // A result for the previous image must not be shown against this one
+        abortRestoration();
         
-        # First try the generations endpoint as a fallback since edits might require special permissions
-        payload = {
-            "model": "gpt-image-1",
-            "prompt": prompt,
-            "n": 1,
-            "size": "1024x1024",
-            "quality": "high",
-            "response_format": "b64_json"
+        // Show preview of the downscaled image that will be uploaded
+        downscaleImage(file, function(jpegBlob) {
+            if (!jpegBlob) {
+                showImageError('This image could not be read. Please try another file.');
+                return;
+            }
+            if (originalPreviewUrl) URL.revokeObjectURL(originalPreviewUrl);
+            originalPreviewUrl = URL.createObjectURL(jpegBlob);
+            originalImageBlob = jpegBlob;
+            
+            imagePreview.src = originalPreviewUrl;
+            imagePreview.classList.remove('hidden');
+            restoreButton.disabled = false;
+        });
+    }
+    
+    // Scale an image so its longest edge fits MAX_UPLOAD_DIMENSION and re-encode as JPEG.
+    // createImageBitmap decodes the file directly (off the main thread where supported),
+    // with no FileReader data URL in between
+    function downscaleImage(file, callback) {
+        createImageBitmap(file)
+            .then(bitmap => {
+                const scale = Math.min(1, MAX_UPLOAD_DIMENSION / Math.max(bitmap.width, bitmap.height));
+                const canvas = document.createElement('canvas');
+                canvas.width = Math.round(bitmap.width * scale);
+                canvas.height = Math.round(bitmap.height * scale);
+                
+                // JPEG has no alpha channel, so flatten transparent PNGs onto white
+                const ctx = canvas.getContext('2d');
+                ctx.fillStyle = '#ffffff';
+                ctx.fillRect(0, 0, canvas.width, canvas.height);
+                ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+                bitmap.close();
+                
+                canvas.toBlob(callback, 'image/jpeg', UPLOAD_JPEG_QUALITY);
+            })
+            .catch(error => {
+                console.error('Could not read image:', error);
+                showImageError('This image could not be read. Please try another file.');
+            });
+    }
+    
+    // Clear the staged image and explain why it was rejected; the button stays disabled
+    function showImageError(message) {
+        resetForm();
+        imageError.textContent = message;
+        imageError.classList.remove('hidden');
+    }
+    
+    // Reset the form
+    function resetForm() {
+        imageInput.value = '';
+        imagePreview.src = '';
+        imagePreview.classList.add('hidden');
+        imageError.classList.add('hidden');
+        restoreButton.disabled = true;
+        originalImageBlob = null;
+        if (originalPreviewUrl) URL.revokeObjectURL(originalPreviewUrl);
+        originalPreviewUrl = null;
+        
+        abortRestoration();
+    }
+    
+    // Drop any restoration still running for the previous image
+    function abortRestoration() {
+        if (restoreController) {
+            restoreController.abort();
+            restoreController = null;
+            loadingIndicator.classList.add('hidden');
+            resultsPlaceholder.classList.remove('hidden');
         }
+    }
+    
+    // Handle restore button click
+    restoreButton.addEventListener('click', function() {
+        const now = performance.now();
+        if (restoreInFlight || now - lastRestoreAt < RESTORE_THROTTLE_MS) return;
+        lastRestoreAt = now;
+        restoreInFlight = true;
         
-        try:
-            # Try to use the generations endpoint first
-            print("🔄 Attempting to use the generations endpoint...")
-            response = requests.post(
-                OPENAI_GENERATIONS_URL, 
-                headers=headers, 
-                json=payload
-            )
-            response.raise_for_status()
+        // Show loading state
+        loadingIndicator.classList.remove('hidden');
+        resultsPlaceholder.classList.add('hidden');
+        resultsContent.classList.add('hidden');
+        resultActions.classList.add('hidden');
+        restoreButton.disabled = true;
+        
+        // Send the JPEG bytes as multipart form data rather than base64 inside JSON
+        const formData = new FormData();
+        formData.append('image', originalImageBlob, 'building.jpg');
+        formData.append('options', JSON.stringify(getOptions()));
+        
+        // Only one restoration runs at a time (see restoreInFlight); resetForm is what aborts it
+        restoreController = new AbortController();
+        
+        fetch('/restore', {
+            method: 'POST',
+            body: formData,
+            signal: restoreController.signal
+        })
+        .then(response => {
+            // Validation errors come back as plain JSON, restorations as an event stream
+            const contentType = response.headers.get('content-type') || '';
+            if (!contentType.startsWith('text/event-stream')) {
+                return response.json();
+            }
+            return readRestorationEvents(response);
+        })
+        .then(data => {
+            // Hide loading indicator
+            loadingIndicator.classList.add('hidden');
             
-            # Success with generations
-            result = response.json()
-            print("✅ Generations endpoint successful")
+            if (data.error) {
+                showRestoreError(data.error, data.help);
+                return;
+            }
+            
+            // The restored image arrives inline; decode it into a Blob URL for the slider and download
+            return fetch(`data:${data.restored_image_type};base64,${data.restored_image}`)
+                .then(response => response.blob())
+                .then(blob => {
+                    if (restoredImageUrl) URL.revokeObjectURL(restoredImageUrl);
+                    restoredImageUrl = URL.createObjectURL(blob);
+                    restoredImageExtension = data.restored_image_type.split('/')[1];
+                    
+                    // Create the before/after comparison slider
+                    createComparisonSlider(originalPreviewUrl, restoredImageUrl);
+                    
+                    // Create restoration details
+                    createRestorationDetails(data);
+                    
+                    // Show results sections
+                    comparisonContainer.classList.remove('hidden');
+                    restorationDetails.classList.remove('hidden');
+                    resultsContent.classList.remove('hidden');
+                    resultActions.classList.remove('hidden');
+                });
+        })
+        .catch(error => {
+            // A superseded or cancelled request leaves the page to whoever aborted it
+            if (error.name === 'AbortError') return;
             
-        except requests.exceptions.RequestException as e:
-            # If generations fails, try to use the edits endpoint
-            print(f"⚠️ Generations endpoint failed: {e}")
-            print("🔄 Falling back to edits endpoint...")
+            console.error('Error restoring image:', error);
+            loadingIndicator.classList.add('hidden');
+            showRestoreError('Could not process your request. Please try again.');
+            restoreButton.disabled = false;
+        })
+        .finally(() => {
+            restoreInFlight = false;
+        });
+    });
+    
+    // Read the /restore event stream, showing progress until the result arrives
+    async function readRestorationEvents(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
             
-            try:
-                # Create multipart form data for edits
-                files = {
-                    'image': ('image.jpg', image_binary, 'image/jpeg'),
-                    'prompt': (None, prompt),
-                    'model': (None, 'gpt-image-1'),
-                    'n': (None, '1'),
-                    'size': (None, 'auto'),
-                    'quality': (None, 'high')
-                }
-                
-                response = requests.post(
-                    OPENAI_EDITS_URL, 
-                    headers={"Authorization": f"Bearer {api_key}"}, 
-                    files=files
-                )
-                response.raise_for_status()
-                result = response.json()
-                print("✅ Edits endpoint successful")
+            let boundary;
+            while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
                 
-            except requests.exceptions.RequestException as e:
-                error_details = str(e)
-                if hasattr(e, 'response') and e.response is not None:
-                    try:
-                        error_json = e.response.json()
-                        if 'error' in error_json:
-                            error_details = f"{error_json['error'].get('message', str(e))}"
-                    except:
-                        pass
+                let eventName = 'message';
+                let eventData = '';
+                rawEvent.split('\\n').forEach(line => {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) eventData += line.slice(6);
+                });
                 
-                raise Exception(f"API Error: {error_details}. Please verify your API key has the proper permissions.")
+                if (eventName === 'status') {
+                    loadingStatus.textContent = JSON.parse(eventData).message;
+                } else if (eventName === 'result') {
+                    loadingStatus.textContent = '';
+                    return JSON.parse(eventData);
+                }
+            }
+        }
         
-        # Extract the response content from result
-        print(f"📊 API response structure: {list(result.keys())}")
+        throw new Error('Restoration stream ended without a result');
+    }
+    
+    // Slider markup is parsed once and cloned for every result
+    const sliderTemplate = document.createElement('template');
+    sliderTemplate.innerHTML = `
+        <h3 class="text-lg font-semibold mb-4 text-center">Before & After Comparison</h3>
+        <div class="comparison-slider">
+            <div class="before-after-container">
+                <img class="before-image" alt="Original Building" decoding="async" fetchpriority="high">
+                <img class="after-image" alt="Restored Building" decoding="async" fetchpriority="high">
+                <div class="slider-handle"></div>
+                <div class="slider-label before-label">Before</div>
+                <div class="slider-label after-label">After</div>
+            </div>
+        </div>
+    `;
+    
+    // Create the before/after comparison slider
+    function createComparisonSlider(beforeSrc, afterSrc) {
+        const slider = sliderTemplate.content.cloneNode(true);
+        const container = slider.querySelector('.before-after-container');
+        container.querySelector('.before-image').src = beforeSrc;
+        container.querySelector('.after-image').src = afterSrc;
         
-        # Get the restored image
-        if 'data' in result and len(result['data']) > 0:
-            if 'b64_json' in result['data'][0]:
-                print("✅ Received base64 image data")
-                restored_img_data = result['data'][0]['b64_json']
-            else:
-                # If image URL is returned instead of base64
-                print("✅ Received image URL, fetching content...")
-                img_url = result['data'][0]['url']
-                img_response = requests.get(img_url)
-                img_response.raise_for_status()
-                restored_img_data = base64.b64encode(img_response.content).decode('utf-8')
-        else:
-            print(f"⚠️ Unexpected API response format: {result}")
-            raise Exception("No image data returned from API")
+        comparisonContainer.replaceChildren(slider);
         
-        # Store the result in the database
-        try:
-            conn = setup_database(DB_PATH)
-            cursor = conn.cursor()
+        // Setup slider functionality on the nodes just inserted
+        setupSlider(container);
+    }
+    
+    // Setup the slider functionality; lookups are scoped to the slider's own container
+    function setupSlider(container) {
+        const handle = container.querySelector('.slider-handle');
+        const afterImage = container.querySelector('.after-image');
+        
+        let isDragging = false;
+        
+        // Leading + trailing frame throttle: the first move is drawn at once, later moves
+        // in the same frame collapse into a single trailing update
+        let frameId = null;
+        let trailingX = null;
+        
+        // Container geometry is measured once per drag rather than on every frame
+        let cachedLeft = 0;
+        let cachedWidth = 1;
+        
+        // Only the handle listens until a drag starts; the document-wide move/end
+        // listeners exist just for the duration of a drag. Touch listeners are passive
+        // so the browser never waits on them before scrolling; the handle's
+        // touch-action: none stops the page from panning during a drag instead
+        handle.addEventListener('mousedown', startDrag);
+        handle.addEventListener('touchstart', startDrag, { passive: true });
+        
+        function startDrag(e) {
+            isDragging = true;
+            // Stop text selection on mouse drags; touch listeners are passive
+            if (e.type === 'mousedown') e.preventDefault();
             
-            cursor.execute(
-                "INSERT INTO results (id, style, prompt, original_image, restored_image, additional_details) VALUES (?, ?, ?, ?, ?, ?)",
-                (result_id, selected_style, prompt, original_img_data, restored_img_data, json.dumps(options))
-            )
+            measureContainer();
+            window.addEventListener('resize', measureContainer, { passive: true });
+            document.addEventListener('mousemove', drag);
+            document.addEventListener('mouseup', stopDrag);
+            document.addEventListener('touchmove', drag, { passive: true });
+            document.addEventListener('touchend', stopDrag, { passive: true });
+        }
+        
+        function measureContainer() {
+            cachedLeft = container.getBoundingClientRect().left;
+            cachedWidth = container.offsetWidth || 1;
+        }
+        
+        function drag(e) {
+            if (!isDragging) return;
             
-            conn.commit()
-            conn.close()
+            let clientX;
+            if (e.type === 'touchmove') {
+                clientX = e.touches[0].clientX;
+            } else {
+                clientX = e.clientX;
+            }
             
-            # Save results to file
-            save_results_file(result_id, {
-                "style": selected_style,
-                "prompt": prompt,
-                "options": options
-            })
+            if (frameId !== null) {
+                trailingX = clientX;
+                return;
+            }
+            updateSlider(clientX);
+            frameId = requestAnimationFrame(flushTrailing);
+        }
+        
+        function flushTrailing() {
+            frameId = null;
+            if (!isDragging || trailingX === null) return;
             
-        except Exception as e:
-            print(f"⚠️ Error saving to database: {e}")
-            raise e
+            const clientX = trailingX;
+            trailingX = null;
+            updateSlider(clientX);
+            frameId = requestAnimationFrame(flushTrailing);
+        }
         
-        return {
-            "id": result_id,
-            "style": selected_style,
-            "prompt": prompt,
-            "original_image": original_img_data,
-            "restored_image": restored_img_data,
-            "options": options,
-            "usage": result.get("usage", {})
+        function updateSlider(clientX) {
+            // Calculate percentage (constrained between 0 and 100)
+            let percent = ((clientX - cachedLeft) / cachedWidth) * 100;
+            percent = Math.max(0, Math.min(100, percent));
+            
+            // Update elements; the handle stays at left: 50% and is shifted from there
+            afterImage.style.clipPath = 'inset(0 ' + (100 - percent) + '% 0 0)';
+            handle.style.transform = 'translateX(' + ((percent - 50) * cachedWidth / 100) + 'px) translateX(-50%)';
         }
         
-    except Exception as e:
-        print(f"⚠️ Error generating restoration: {e}")
-        return {
-            "error": str(e),
-            "id": result_id
+        function stopDrag() {
+            isDragging = false;
+            
+            // Drop any frame still queued so the handle doesn't jump after release
+            if (frameId !== null) cancelAnimationFrame(frameId);
+            frameId = null;
+            trailingX = null;
+            
+            window.removeEventListener('resize', measureContainer);
+            document.removeEventListener('mousemove', drag);
+            document.removeEventListener('mouseup', stopDrag);
+            document.removeEventListener('touchmove', drag, { passive: true });
+            document.removeEventListener('touchend', stopDrag, { passive: true });
+        }
+    }
+    
+    // Features listed in the details panel for each enabled option
+    const FEATURE_LABELS = [
+        ['preserve_heritage', 'Heritage elements preserved'],
+        ['landscaping', 'Enhanced landscaping and greenery'],
+        ['lighting', 'Architectural lighting highlighted'],
+        ['expand_building', 'Tasteful expansion considered']
+    ];
+    
+    // Create an element with optional classes and text content
+    function createElement(tag, className, text) {
+        const element = document.createElement(tag);
+        if (className) element.className = className;
+        if (text !== undefined) element.textContent = text;
+        return element;
+    }
+    
+    // Troubleshooting steps shown alongside errors that come with help text
+    const TROUBLESHOOTING_TIPS = [
+        'Make sure your OpenAI API key is set in the environment variables',
+        'Verify your API key has access to the GPT Image API (may require subscription)',
+        'Check that your OpenAI account has billing information set up'
+    ];
+    
+    // Show an error in the results panel; error text can echo API messages, so it is never parsed as HTML
+    function showRestoreError(error, help) {
+        const message = createElement('span', null, `Error: ${error}`);
+        
+        if (help) {
+            const tips = createElement('div', 'mt-3 p-3 bg-base-300 rounded text-sm');
+            const list = createElement('ul', 'list-disc list-inside mt-1');
+            TROUBLESHOOTING_TIPS.forEach(tip => list.appendChild(createElement('li', null, tip)));
+            tips.append(createElement('strong', null, 'Troubleshooting:'), list);
+            message.append(createElement('div', 'mt-2 text-sm', help), tips);
+        }
+        
+        const alert = createElement('div', 'alert alert-error');
+        alert.appendChild(message);
+        comparisonContainer.replaceChildren(alert);
+        comparisonContainer.classList.remove('hidden');
+        resultsContent.classList.remove('hidden');
+    }
+    
+    // Create restoration details section; built as DOM nodes so API text is never parsed as HTML
+    function createRestorationDetails(data) {
+        const options = data.options || {};
+        
+        const panel = createElement('div', 'bg-base-200 p-4 rounded-lg');
+        
+        const header = createElement('div', 'flex justify-between items-center mb-2');
+        header.append(
+            createElement('h3', 'text-lg font-bold', 'Restoration Details'),
+            createElement('span', 'badge badge-primary', data.style)
+        );
+        
+        const features = createElement('div', 'mb-2');
+        const featureList = createElement('ul', 'list-disc list-inside text-sm mt-2');
+        FEATURE_LABELS.forEach(([option, label]) => {
+            if (options[option]) featureList.appendChild(createElement('li', null, label));
+        });
+        features.append(createElement('span', 'font-semibold', 'Features:'), featureList);
+        
+        const prompt = createElement('div', 'mb-2');
+        prompt.append(
+            createElement('span', 'font-semibold', 'Prompt Used:'),
+            createElement('p', 'text-sm mt-1', data.prompt)
+        );
+        
+        panel.append(header, features, prompt);
+        
+        // Add usage details if available
+        if (data.usage) {
+            const usage = createElement('div', 'text-xs text-base-content/70 mt-4');
+            usage.appendChild(createElement('p', null, `Tokens used: ${data.usage.total_tokens || 'N/A'}`));
+            panel.appendChild(usage);
+        }
+        
+        const fragment = document.createDocumentFragment();
+        fragment.appendChild(panel);
+        restorationDetails.replaceChildren(fragment);
+    }
+    
+    // Setup download button
+    downloadButton.addEventListener('click', function() {
+        if (!restoredImageUrl) return;
+        
+        // Create download link
+        const link = document.createElement('a');
+        link.href = restoredImageUrl;
+        link.download = `restored_building.${restoredImageExtension}`;
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+    });
+    
+    // Setup new button
+    newButton.addEventListener('click', function() {
+        // Reset form
+        resetForm();
+        
+        // Reset results
+        resultsPlaceholder.classList.remove('hidden');
+        resultsContent.classList.add('hidden');
+        resultActions.classList.add('hidden');
+        comparisonContainer.classList.add('hidden');
+        restorationDetails.classList.add('hidden');
+        
+        // Reset state
+        originalImageBlob = null;
+        if (restoredImageUrl) URL.revokeObjectURL(restoredImageUrl);
+        restoredImageUrl = null;
+    });
+    
+    // Set up drag and drop; the file input sits inside the dropzone label
+    const dropzone = imageInput.closest('label');
+    
+    function stopDragEvent(e) {
+        e.preventDefault();
+        e.stopPropagation();
+    }
+    
+    // dragover fires at pointer rate, so its highlight is applied at most once per frame;
+    // cancelling must stay synchronous or the drop is refused
+    let dragOverFrame = null;
+    
+    function highlightDropzone() {
+        dragOverFrame = null;
+        dropzone.classList.add('bg-base-200');
+    }
+    
+    function clearDropzone() {
+        if (dragOverFrame !== null) {
+            cancelAnimationFrame(dragOverFrame);
+            dragOverFrame = null;
+        }
+        dropzone.classList.remove('bg-base-200');
+    }
+    
+    // One listener per event: cancel the default, toggle the highlight, and handle the drop
+    const dropzoneHandlers = {
+        dragenter: e => { stopDragEvent(e); dropzone.classList.add('bg-base-200'); },
+        dragover: e => {
+            stopDragEvent(e);
+            if (dragOverFrame === null) dragOverFrame = requestAnimationFrame(highlightDropzone);
+        },
+        dragleave: e => { stopDragEvent(e); clearDropzone(); },
+        drop: e => { stopDragEvent(e); clearDropzone(); handleDrop(e); }
+    };
+    Object.entries(dropzoneHandlers).forEach(([eventName, handler]) => {
+        dropzone.addEventListener(eventName, handler);
+    });
+    
+    // Handle file drop
+    function handleDrop(e) {
+        const file = e.dataTransfer.files[0];
+        
+        if (file) {
+            handleImageFile(file);
         }
+    }
+});
+"""
 
 # Main FastHTML Server with defined routes
 @app.function(
@@ -320,145 +1336,96 @@ def restore_building_image(image_data: str, options: Dict[str, Any]) -> Dict[str
     volumes={DATA_DIR: building_volume},
     cpu=1.0,
     timeout=3600,
-    secrets=[openai_secret]  # Add the secret here too
+    secrets=[openai_secret],  # Add the secret here too
+    # Requests mostly await restoration containers, so one event loop serves many at once;
+    # this is also what lets duplicate submissions find each other in inflight_restorations
+    allow_concurrent_inputs=32
 )
 @modal.asgi_app()
 def serve():
     """Main FastHTML Server for Building Restoration Dashboard"""
-    # Set up the FastHTML app with required headers
+    # Web-only dependencies are imported here so the restoration container never loads them
+    from fasthtml.common import (
+        fast_app, to_xml, Html, Head, Body, Title, Main, Div, H1, H2, H3, P, Span,
+        Label, Input, Select, Option, Button, Img, Link, Script, Meta
+    )
+    from starlette.responses import Response, JSONResponse, HTMLResponse, StreamingResponse
+    from starlette.routing import Route
+    from starlette.middleware.gzip import GZipMiddleware
+    
+    class ORJSONResponse(JSONResponse):
+        """JSONResponse rendered with orjson, which is much faster on base64 image payloads"""
+        def render(self, content: Any) -> bytes:
+            return orjson.dumps(content)
+    
+    # Static assets are held in memory and versioned by content hash, so browsers can cache them indefinitely
+    static_assets = {
+        "theme.css": (THEME_CSS.encode(), "text/css"),
+        "app.js": (APP_JS.encode(), "text/javascript")
+    }
+    for name in ("daisyui.css", "tailwind.min.css"):
+        with open(os.path.join(ASSETS_DIR, name), "rb") as f:
+            static_assets[name] = (f.read(), "text/css")
+    static_versions = {name: hashlib.sha256(body).hexdigest()[:12] for name, (body, _) in static_assets.items()}
+    
+    async def static_asset(request):
+        """Serve an in-memory static asset with a long-lived cache header"""
+        asset = static_assets.get(request.path_params["name"])
+        if asset is None:
+            return Response("Not found", status_code=404)
+        body, media_type = asset
+        return Response(body, media_type=media_type, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+    
+    # Set up the FastHTML app with required headers; the asset route is passed in here so it
+    # is matched before FastHTML's catch-all static file route
     fasthtml_app, rt = fast_app(
+        routes=[Route("/static/{name}", static_asset)],
+        # FastHTML's defaults pull Pico, htmx, surreal and friends from CDNs as render-blocking
+        # scripts; the page uses none of them, so only its own assets are loaded
+        default_hdrs=False,
         hdrs=(
-            Link(rel="stylesheet", href="https://cdn.jsdelivr.net/npm/daisyui@3.9.2/dist/full.css"),
-            Link(rel="stylesheet", href="https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css"),
-            Script(src="https://unpkg.com/htmx.org@1.9.10"),
-            # Add custom theme styles
-            Style("""
-                :root {
-                --color-base-100: oklch(98% 0.002 247.839);
-                --color-base-200: oklch(96% 0.003 264.542);
-                --color-base-300: oklch(92% 0.006 264.531);
-                --color-base-content: oklch(21% 0.034 264.665);
-                --color-primary: oklch(47% 0.196 209.957);  /* Blue for architecture */
-                --color-primary-content: oklch(97% 0.014 254.604);
-                --color-secondary: oklch(74% 0.134 119.635);  /* Green for renewal */
-                --color-secondary-content: oklch(13% 0.028 261.692);
-                --color-accent: oklch(71% 0.134 41.252);     /* Tan accent for buildings */
-                --color-accent-content: oklch(97% 0.014 254.604);
-                --color-neutral: oklch(13% 0.028 261.692);
-                --color-neutral-content: oklch(98% 0.002 247.839);
-                --color-info: oklch(58% 0.158 241.966);
-                --color-info-content: oklch(97% 0.013 236.62);
-                --color-success: oklch(62% 0.194 149.214);
-                --color-success-content: oklch(98% 0.018 155.826);
-                --color-warning: oklch(66% 0.179 58.318);
-                --color-warning-content: oklch(98% 0.022 95.277);
-                --color-error: oklch(59% 0.249 0.584);
-                --color-error-content: oklch(97% 0.014 343.198);
-                }
-
-                /* Custom styling */
-                .text-arch-blue {
-                    color: oklch(47% 0.196 209.957);
-                }
-                
-                .bg-renew-green {
-                    background-color: oklch(74% 0.134 119.635);
-                }
-                
-                .custom-border {
-                    border-color: var(--color-base-300);
-                }
-
-                /* Comparison slider */
-                .comparison-slider {
-                    position: relative;
-                    width: 100%;
-                    overflow: hidden;
-                    border-radius: 0.5rem;
-                    margin: 1rem 0;
-                }
-                
-                .before-after-container {
-                    position: relative;
-                    width: 100%;
-                    height: 400px;
-                }
-                
-                .before-image,
-                .after-image {
-                    position: absolute;
-                    top: 0;
-                    left: 0;
-                    width: 100%;
-                    height: 100%;
-                    object-fit: cover;
-                }
-                
-                .after-container {
-                    position: absolute;
-                    top: 0;
-                    left: 0;
-                    width: 50%;
-                    height: 100%;
-                    overflow: hidden;
-                }
-                
-                .slider-handle {
-                    position: absolute;
-                    top: 0;
-                    bottom: 0;
-                    left: 50%;
-                    width: 4px;
-                    background: white;
-                    transform: translateX(-50%);
-                    cursor: ew-resize;
-                    z-index: 10;
-                }
-                
-                .slider-handle::before {
-                    content: '';
-                    position: absolute;
-                    top: 50%;
-                    left: 50%;
-                    transform: translate(-50%, -50%);
-                    width: 30px;
-                    height: 30px;
-                    background: white;
-                    border-radius: 50%;
-                    box-shadow: 0 0 5px rgba(0,0,0,0.5);
-                }
-                
-                .slider-label {
-                    position: absolute;
-                    top: 10px;
-                    padding: 5px 10px;
-                    background: rgba(0,0,0,0.7);
-                    color: white;
-                    border-radius: 4px;
-                    font-size: 12px;
-                    z-index: 5;
-                }
-                
-                .before-label {
-                    left: 10px;
-                }
-                
-                .after-label {
-                    right: 10px;
-                }
-            """),
-        )
+            Meta(charset="utf-8"),
+            Meta(name="viewport", content="width=device-width, initial-scale=1, viewport-fit=cover"),
+            *(Link(rel="stylesheet", href=f"/static/{name}?v={static_versions[name]}")
+              for name in ("daisyui.css", "tailwind.min.css", "theme.css")),
+            Script(src=f"/static/app.js?v={static_versions['app.js']}", defer=True),
+        ),
+        # Theme and page background are set once on the document, not on inner wrappers
+        htmlkw={"data_theme": "light"},
+        bodykw={"cls": "min-h-screen bg-base-100"}
     )
     
-    # Ensure database exists
-    setup_database(DB_PATH)
+    # Compress HTML, JSON and the static CSS/JS (the /restore event stream opts out)
+    fasthtml_app.add_middleware(GZipMiddleware, minimum_size=500)
+    
+    # Open the shared database connection once at container start
+    get_db_connection()
+    
+    # Seconds between keep-alive comments on the /restore event stream
+    SSE_KEEPALIVE_SECONDS = 15
+    
+    def sse_event(event: str, data: Dict[str, Any]) -> bytes:
+        return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+    
+    # Restorations in flight, keyed by image + options, so duplicate submissions share one API call
+    inflight_restorations: Dict[str, asyncio.Task] = {}
+    
+    async def run_restoration(image_binary: bytes, options: Dict[str, Any]) -> Dict[str, Any]:
+        result = await restore_building_image.remote.aio(image_binary, options)
+        if "restored_image" not in result:
+            return result
+        
+        # The image travels in the result event itself: a follow-up GET may land on another
+        # serve container, which can't see this one's memory or the not-yet-committed volume
+        result = dict(result)
+        result["restored_image_type"] = sniff_image_type(base64.b64decode(result["restored_image"][:16]))
+        return result
     
     #################################################
-    # Homepage Route - Building Restoration Dashboard
+    # Homepage - Building Restoration Dashboard
     #################################################
-    @rt("/")
-    def homepage():
-        """Render the building restoration dashboard"""
+    def render_homepage():
+        """Build the building restoration dashboard components"""
         
         # Create toggle switches for restoration options
         def create_toggle(name, label, checked=False):
@@ -492,10 +1459,24 @@ def serve():
                 cls="mb-4"
             )
         
+        # Create output quality selection dropdown
+        def create_quality_dropdown():
+            return Div(
+                Label("Output Quality", cls="label font-medium mb-2"),
+                Select(
+                    Option("Fast preview", value="fast", selected=DEFAULT_QUALITY == "fast"),
+                    Option("High quality (slower)", value="hd", selected=DEFAULT_QUALITY == "hd"),
+                    name="quality",
+                    cls="select select-bordered w-full"
+                ),
+                cls="mb-4"
+            )
+        
         # Restoration options panel
         restoration_options = Div(
             H3("Restoration Options", cls="text-lg font-semibold mb-4 text-arch-blue"),
             create_style_dropdown(),
+            create_quality_dropdown(),
             create_toggle("preserve_heritage", "Preserve Heritage Elements"),
             create_toggle("landscaping", "Add Landscaping & Greenery"),
             create_toggle("lighting", "Enhance with Architectural Lighting"),
@@ -531,8 +1512,10 @@ def serve():
                 Img(
                     id="image-preview",
                     src="",
+                    decoding="async",
                     cls="max-h-64 mx-auto hidden object-contain rounded-lg border shadow-sm"
                 ),
+                P(id="image-error", cls="text-error text-sm text-center mt-2 hidden"),
                 cls="mb-6"
             ),
             cls="mb-8"
@@ -560,6 +1543,7 @@ def serve():
                     cls="loading loading-spinner loading-lg text-primary",
                     id="loading-indicator"
                 ),
+                P("", id="loading-status", cls="ml-3 text-sm text-base-content/70"),
                 cls="flex justify-center items-center h-32 hidden"
             ),
             Div(
@@ -605,361 +1589,8 @@ def serve():
             cls="w-full md:w-1/2 bg-base-100 p-6 rounded-lg shadow-lg custom-border border"
         )
         
-        # Add script for form handling
-        form_script = Script("""
-        document.addEventListener('DOMContentLoaded', function() {
-            // Form elements
-            const imageInput = document.getElementById('image-input');
-            const imagePreview = document.getElementById('image-preview');
-            const restoreButton = document.getElementById('restore-button');
-            
-            // Results elements
-            const loadingIndicator = document.getElementById('loading-indicator').parentElement;
-            const resultsPlaceholder = document.getElementById('results-placeholder');
-            const resultsContent = document.getElementById('results-content');
-            const comparisonContainer = document.getElementById('comparison-container');
-            const restorationDetails = document.getElementById('restoration-details');
-            const resultActions = document.getElementById('result-actions');
-            const downloadButton = document.getElementById('download-button');
-            const newButton = document.getElementById('new-button');
-            
-            // State variables
-            let originalImageData = null;
-            let restoredImageData = null;
-            
-            // Check for demo mode (if no API key is available)
-            const isDemoMode = false; // This can be set server-side if needed
-            
-            // Get options from the form
-            function getOptions() {
-                return {
-                    style: document.querySelector('select[name="style"]').value,
-                    preserve_heritage: document.querySelector('input[name="preserve_heritage"]').checked,
-                    landscaping: document.querySelector('input[name="landscaping"]').checked,
-                    lighting: document.querySelector('input[name="lighting"]').checked,
-                    expand_building: document.querySelector('input[name="expand_building"]').checked
-                };
-            }
-            
-            // Handle image upload
-            imageInput.addEventListener('change', function(event) {
-                const file = event.target.files[0];
-                
-                if (!file) {
-                    resetForm();
-                    return;
-                }
-                
-                // Show preview
-                const reader = new FileReader();
-                reader.onload = function(e) {
-                    imagePreview.src = e.target.result;
-                    imagePreview.classList.remove('hidden');
-                    restoreButton.disabled = false;
-                    
-                    // Store the base64 data (remove the data URL prefix)
-                    originalImageData = e.target.result.split(',')[1];
-                };
-                
-                reader.readAsDataURL(file);
-            });
-            
-            // Reset the form
-            function resetForm() {
-                imageInput.value = '';
-                imagePreview.src = '';
-                imagePreview.classList.add('hidden');
-                restoreButton.disabled = true;
-                originalImageData = null;
-            }
-            
-            // Handle restore button click
-            restoreButton.addEventListener('click', function() {
-                // Show loading state
-                loadingIndicator.classList.remove('hidden');
-                resultsPlaceholder.classList.add('hidden');
-                resultsContent.classList.add('hidden');
-                resultActions.classList.add('hidden');
-                restoreButton.disabled = true;
-                
-                // Send request to API
-                fetch('/restore', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({
-                        image_data: originalImageData,
-                        options: getOptions()
-                    })
-                })
-                .then(response => response.json())
-                .then(data => {
-                    // Hide loading indicator
-                    loadingIndicator.classList.add('hidden');
-                    
-                    if (data.error) {
-                        // Show error message with help text if available
-                        let errorMessage = `Error: ${data.error}`;
-                        
-                        if (data.help) {
-                            errorMessage += `<div class="mt-2 text-sm">${data.help}</div>`;
-                            errorMessage += `<div class="mt-3 p-3 bg-base-300 rounded text-sm">
-                                <strong>Troubleshooting:</strong>
-                                <ul class="list-disc list-inside mt-1">
-                                    <li>Make sure your OpenAI API key is set in the environment variables</li>
-                                    <li>Verify your API key has access to the GPT Image API (may require subscription)</li>
-                                    <li>Check that your OpenAI account has billing information set up</li>
-                                </ul>
-                            </div>`;
-                        }
-                        
-                        comparisonContainer.innerHTML = `
-                            <div class="alert alert-error">
-                                <span>${errorMessage}</span>
-                            </div>
-                        `;
-                        comparisonContainer.classList.remove('hidden');
-                        resultsContent.classList.remove('hidden');
-                        return;
-                    }
-                    
-                    // Store the restored image data
-                    restoredImageData = data.restored_image;
-                    
-                    // Create the before/after comparison slider
-                    createComparisonSlider(originalImageData, restoredImageData);
-                    
-                    // Create restoration details
-                    createRestorationDetails(data);
-                    
-                    // Show results sections
-                    comparisonContainer.classList.remove('hidden');
-                    restorationDetails.classList.remove('hidden');
-                    resultsContent.classList.remove('hidden');
-                    resultActions.classList.remove('hidden');
-                })
-                .catch(error => {
-                    console.error('Error restoring image:', error);
-                    loadingIndicator.classList.add('hidden');
-                    comparisonContainer.innerHTML = `
-                        <div class="alert alert-error">
-                            <span>Error: Could not process your request. Please try again.</span>
-                        </div>
-                    `;
-                    comparisonContainer.classList.remove('hidden');
-                    resultsContent.classList.remove('hidden');
-                    restoreButton.disabled = false;
-                });
-            });
-            
-            // Create the before/after comparison slider
-            function createComparisonSlider(beforeImgData, afterImgData) {
-                const beforeSrc = 'data:image/jpeg;base64,' + beforeImgData;
-                const afterSrc = 'data:image/jpeg;base64,' + afterImgData;
-                
-                const sliderHTML = `
-                    <h3 class="text-lg font-semibold mb-4 text-center">Before & After Comparison</h3>
-                    <div class="comparison-slider">
-                        <div class="before-after-container">
-                            <img src="${beforeSrc}" class="before-image" alt="Original Building">
-                            <div class="after-container" style="width: 50%;">
-                                <img src="${afterSrc}" class="after-image" alt="Restored Building">
-                            </div>
-                            <div class="slider-handle"></div>
-                            <div class="slider-label before-label">Before</div>
-                            <div class="slider-label after-label">After</div>
-                        </div>
-                    </div>
-                `;
-                
-                // Set HTML
-                comparisonContainer.innerHTML = sliderHTML;
-                
-                // Setup slider functionality
-                setupSlider();
-            }
-            
-            // Setup the slider functionality
-            function setupSlider() {
-                const container = document.querySelector('.before-after-container');
-                const handle = document.querySelector('.slider-handle');
-                const afterContainer = document.querySelector('.after-container');
-                
-                let isDragging = false;
-                
-                // Handle mouse events
-                handle.addEventListener('mousedown', startDrag);
-                document.addEventListener('mousemove', drag);
-                document.addEventListener('mouseup', stopDrag);
-                
-                // Handle touch events
-                handle.addEventListener('touchstart', startDrag);
-                document.addEventListener('touchmove', drag);
-                document.addEventListener('touchend', stopDrag);
-                
-                function startDrag(e) {
-                    isDragging = true;
-                    e.preventDefault();
-                }
-                
-                function drag(e) {
-                    if (!isDragging) return;
-                    
-                    let clientX;
-                    if (e.type === 'touchmove') {
-                        clientX = e.touches[0].clientX;
-                    } else {
-                        clientX = e.clientX;
-                    }
-                    
-                    const rect = container.getBoundingClientRect();
-                    const x = clientX - rect.left;
-                    const width = container.offsetWidth;
-                    
-                    // Calculate percentage (constrained between 0 and 100)
-                    let percent = (x / width) * 100;
-                    percent = Math.max(0, Math.min(100, percent));
-                    
-                    // Update elements
-                    afterContainer.style.width = percent + '%';
-                    handle.style.left = percent + '%';
-                }
-                
-                function stopDrag() {
-                    isDragging = false;
-                }
-            }
-            
-            // Create restoration details section
-            function createRestorationDetails(data) {
-                const style = data.style;
-                const options = data.options;
-                
-                let featuresHTML = '<ul class="list-disc list-inside text-sm mt-2">';
-                
-                if (options.preserve_heritage) {
-                    featuresHTML += '<li>Heritage elements preserved</li>';
-                }
-                if (options.landscaping) {
-                    featuresHTML += '<li>Enhanced landscaping and greenery</li>';
-                }
-                if (options.lighting) {
-                    featuresHTML += '<li>Architectural lighting highlighted</li>';
-                }
-                if (options.expand_building) {
-                    featuresHTML += '<li>Tasteful expansion considered</li>';
-                }
-                
-                featuresHTML += '</ul>';
-                
-                // Create usage details if available
-                let usageHTML = '';
-                if (data.usage) {
-                    usageHTML = `
-                        <div class="text-xs text-base-content/70 mt-4">
-                            <p>Tokens used: ${data.usage.total_tokens || 'N/A'}</p>
-                        </div>
-                    `;
-                }
-                
-                // Create details HTML
-                const detailsHTML = `
-                    <div class="bg-base-200 p-4 rounded-lg">
-                        <div class="flex justify-between items-center mb-2">
-                            <h3 class="text-lg font-bold">Restoration Details</h3>
-                            <span class="badge badge-primary">${style}</span>
-                        </div>
-                        <div class="mb-2">
-                            <span class="font-semibold">Features:</span>
-                            ${featuresHTML}
-                        </div>
-                        <div class="mb-2">
-                            <span class="font-semibold">Prompt Used:</span>
-                            <p class="text-sm mt-1">${data.prompt}</p>
-                        </div>
-                        ${usageHTML}
-                    </div>
-                `;
-                
-                // Set HTML
-                restorationDetails.innerHTML = detailsHTML;
-            }
-            
-            // Setup download button
-            downloadButton.addEventListener('click', function() {
-                if (!restoredImageData) return;
-                
-                // Create download link
-                const link = document.createElement('a');
-                link.href = 'data:image/jpeg;base64,' + restoredImageData;
-                link.download = 'restored_building.jpg';
-                document.body.appendChild(link);
-                link.click();
-                document.body.removeChild(link);
-            });
-            
-            // Setup new button
-            newButton.addEventListener('click', function() {
-                // Reset form
-                resetForm();
-                
-                // Reset results
-                resultsPlaceholder.classList.remove('hidden');
-                resultsContent.classList.add('hidden');
-                resultActions.classList.add('hidden');
-                comparisonContainer.classList.add('hidden');
-                restorationDetails.classList.add('hidden');
-                
-                // Reset state
-                originalImageData = null;
-                restoredImageData = null;
-            });
-            
-            // Set up drag and drop
-            const dropzone = document.querySelector('label[for="image-input"]');
-            
-            ['dragenter', 'dragover', 'dragleave', 'drop'].forEach(eventName => {
-                dropzone.addEventListener(eventName, function(e) {
-                    e.preventDefault();
-                    e.stopPropagation();
-                });
-            });
-            
-            // Highlight on drag
-            ['dragenter', 'dragover'].forEach(eventName => {
-                dropzone.addEventListener(eventName, function() {
-                    dropzone.classList.add('bg-base-200');
-                });
-            });
-            
-            // Remove highlight on drag leave/drop
-            ['dragleave', 'drop'].forEach(eventName => {
-                dropzone.addEventListener(eventName, function() {
-                    dropzone.classList.remove('bg-base-200');
-                });
-            });
-            
-            // Handle file drop
-            dropzone.addEventListener('drop', function(e) {
-                const file = e.dataTransfer.files[0];
-                
-                if (file) {
-                    // Update file input
-                    const dataTransfer = new DataTransfer();
-                    dataTransfer.items.add(file);
-                    imageInput.files = dataTransfer.files;
-                    
-                    // Trigger change event
-                    const event = new Event('change');
-                    imageInput.dispatchEvent(event);
-                }
-            });
-        });
-        """)
         
         return Title("Building Restoration Visualizer"), Main(
-            form_script,
             Div(
                 H1("Building Restoration Visualizer", cls="text-3xl font-bold text-center mb-2 text-arch-blue"),
                 P("Powered by OpenAI's GPT Image AI", cls="text-center mb-8 text-base-content/70"),
@@ -969,11 +1600,23 @@ def serve():
                     cls="flex flex-col md:flex-row gap-6 w-full"
                 ),
                 cls="container mx-auto px-4 py-8 max-w-6xl"
-            ),
-            cls="min-h-screen bg-base-100",
-            data_theme="light"
+            )
         )
     
+    # The dashboard has no per-request content, so render the full document once; this Html
+    # doesn't emit a doctype, and without one browsers fall back to quirks mode
+    page_title, page_main = render_homepage()
+    homepage_html = "<!doctype html>\n" + to_xml(Html(
+        Head(page_title, *fasthtml_app.hdrs),
+        Body(page_main, *fasthtml_app.ftrs, **fasthtml_app.bodykw),
+        **fasthtml_app.htmlkw
+    ))
+    
+    @rt("/")
+    def homepage():
+        """Serve the pre-rendered building restoration dashboard"""
+        return HTMLResponse(homepage_html, headers={"Cache-Control": "public, max-age=300"})
+    
     #################################################
     # Restoration API Endpoint
     #################################################
@@ -981,37 +1624,80 @@ def serve():
     async def api_restore_building(request):
         """API endpoint to generate building restoration using OpenAI"""
         try:
-            # Get image data and options from request JSON
-            data = await request.json()
-            image_data = data.get("image_data", "")
-            options = data.get("options", {})
+            # A body this small can't hold an image; reject it before parsing the form
+            content_length = request.headers.get("content-length", "")
+            if content_length.isdigit() and int(content_length) < 100:
+                return ORJSONResponse({"error": "No image data provided"}, status_code=400)
+            
+            # Get the uploaded image and JSON-encoded options from the multipart form
+            form = await request.form()
+            upload = form.get("image")
+            image_binary = b"" if upload is None or isinstance(upload, str) else await upload.read()
+            try:
+                options = orjson.loads(form.get("options") or "{}")
+            except orjson.JSONDecodeError:
+                options = None
+            if not isinstance(options, dict):
+                return ORJSONResponse({"error": "Options must be a JSON object"}, status_code=400)
             
-            if not image_data:
-                return JSONResponse({"error": "No image data provided"}, status_code=400)
+            if not image_binary:
+                return ORJSONResponse({"error": "No image data provided"}, status_code=400)
             
             # Check for API key - the secret should be loaded into env vars
             api_key = os.environ.get("OPENAI_API_KEY")
             if not api_key:
-                # Add detailed diagnostics
+                # Environment diagnostics go to the server log only; clients just get the fix
                 env_vars = {k: "PRESENT" if v else "MISSING" for k, v in os.environ.items() 
-                           if k.startswith("OPENAI") or k.endswith("KEY") or k == "PATH"}
+                           if k.startswith("OPENAI") or k.endswith("KEY")}
+                print(f"⚠️ OPENAI_API_KEY missing, related environment variables: {env_vars}")
                 
-                return JSONResponse({
+                return ORJSONResponse({
                     "error": "OpenAI API key not found in environment variables.",
-                    "help": "You need to create a Modal secret with 'modal secret create openai-api-key OPENAI_API_KEY=your-key'",
-                    "debug_info": {
-                        "env_diagnostic": env_vars
-                    }
+                    "help": "You need to create a Modal secret with 'modal secret create openai-api-key OPENAI_API_KEY=your-key'"
                 }, status_code=401)
             
-            # Call the restoration function
-            result = restore_building_image.remote(image_data, options)
+            # The browser aborts superseded requests; don't start an API call nobody will read
+            if await request.is_disconnected():
+                print("⚠️ Client disconnected before restoration started")
+                return Response(status_code=204)
+            
+            # Join an identical restoration that is already running, or start one
+            request_key = hashlib.blake2b(
+                image_binary + orjson.dumps(options, option=orjson.OPT_SORT_KEYS),
+                digest_size=16
+            ).hexdigest()
+            task = inflight_restorations.get(request_key)
+            if task is None:
+                task = asyncio.ensure_future(run_restoration(image_binary, options))
+                inflight_restorations[request_key] = task
+                task.add_done_callback(lambda _: inflight_restorations.pop(request_key, None))
             
-            return JSONResponse(result)
+            # Acknowledge straight away, then stream the result when it is ready
+            async def restoration_events():
+                yield sse_event("status", {"message": "Generating restoration..."})
+                while True:
+                    try:
+                        result = await asyncio.wait_for(asyncio.shield(task), SSE_KEEPALIVE_SECONDS)
+                        break
+                    except asyncio.TimeoutError:
+                        yield b": keep-alive\n\n"
+                    except Exception as e:
+                        logger.exception("Error restoring image")
+                        result = {"error": str(e)}
+                        break
+                yield sse_event("result", result)
+            
+            return StreamingResponse(
+                restoration_events(),
+                media_type="text/event-stream",
+                # GZipMiddleware leaves responses that already declare an encoding alone; older
+                # Starlette releases would otherwise buffer every event until the stream ends
+                headers={"Cache-Control": "no-cache", "Content-Encoding": "identity"}
+            )
                 
         except Exception as e:
-            print(f"Error restoring image: {e}")
-            return JSONResponse({"error": str(e)}, status_code=500)
+            logger.exception("Error restoring image")
+            return ORJSONResponse({"error": str(e)}, status_code=500)
     
     # Return the FastHTML app
     return fasthtml_app